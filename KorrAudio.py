@@ -6,23 +6,86 @@
 # http://www.gnu.org/licenses/gpl-3.0.html
 
 import datetime
+import functools
 import hashlib
+import importlib.metadata
+import mmap
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-import librosa
-import matplotlib.pyplot as plt
 import numpy as np
-import soundfile as sf
-from tinytag import TinyTag
-from librosa.feature import chroma_stft
+
+# librosa, matplotlib, numba, scipy, soundfile and tinytag are imported inside
+# the functions that use them, so the window opens without waiting for them
 
 import tkinter as tk
 from tkinter import filedialog, scrolledtext, messagebox, ttk
 
 SUPPORTED_FORMATS = ["mp3", "wav", "ogg", "flac", "aiff"]
 
+CHROMA_NOTES = ("C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B")
+
+# Sample rate used for tempo and chroma, which do not need the full band
+FEATURE_SAMPLE_RATE = 11025
+
+# Mean chroma is computed over this many evenly spaced windows of the file
+CHROMA_WINDOWS = 8
+CHROMA_WINDOW_SECONDS = 4
+
+# Decoded mono audio of the last loaded file, keyed by (path, modification time),
+# holding one (audio, sample_rate, num_channels) entry per requested sample rate
+_AUDIO_CACHE = {}
+
+def load_audio(file_path, target_sr=None):
+    import soundfile as sf
+
+    key = (file_path, os.stat(file_path).st_mtime_ns)
+    cached = _AUDIO_CACHE.get(key)
+
+    if cached is None:
+        try:
+            # Open the file once for both the header and the samples
+            with sf.SoundFile(file_path) as sound_file:
+                sample_rate = sound_file.samplerate
+                num_channels = sound_file.channels
+                buffer = np.empty((sound_file.frames, num_channels), dtype=np.float32)
+                frames = sound_file.read(out=buffer)
+        except RuntimeError:
+            # Formats libsndfile cannot decode go through librosa;
+            # keep the native sample rate, resampling is not needed for analysis
+            import librosa
+            frames, sample_rate = librosa.load(file_path, sr=None, mono=False, dtype=np.float32)
+            frames = np.atleast_2d(frames).T
+            num_channels = frames.shape[1]
+
+        audio = frames.mean(axis=1, dtype=np.float32) if num_channels > 1 else frames[:, 0]
+
+        # All analysis and plot functions share this buffer, so make it
+        # contiguous float32 once instead of letting each of them copy it
+        audio = np.ascontiguousarray(audio, dtype=np.float32)
+        cached = {None: (audio, sample_rate, num_channels)}
+        _AUDIO_CACHE.clear()
+        _AUDIO_CACHE[key] = cached
+
+    if target_sr not in cached:
+        audio, sample_rate, num_channels = cached[None]
+        if target_sr < sample_rate:
+            import librosa
+            audio = librosa.resample(audio, orig_sr=sample_rate, target_sr=target_sr, res_type='polyphase')
+            audio = np.ascontiguousarray(audio, dtype=np.float32)
+            sample_rate = target_sr
+        cached[target_sr] = (audio, sample_rate, num_channels)
+
+    return cached[target_sr]
+
 # Audio analysis functions
 def analyze_audio(file_path):
+    import librosa
+    from librosa.feature import chroma_stft
+    from tinytag import TinyTag
+
+    setup_fft_backend()
+
     # Get the audio file format
     file_format = os.path.splitext(file_path)[1][1:].strip().lower()
 
@@ -32,46 +95,52 @@ def analyze_audio(file_path):
     # Get file information
     file_info = os.stat(file_path)
     modification_time = datetime.datetime.fromtimestamp(file_info.st_mtime)
-    file_hash = calculate_file_hash(file_path)
-
-    # Load the audio file
-    audio, sample_rate = librosa.load(file_path)
 
-    # Calculate the sample rate
-    bitrate = sf.info(file_path).samplerate
+    # Load the audio file while hashing and reading metadata in the background
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        hash_future = executor.submit(calculate_file_hash, file_path)
+        tag_future = executor.submit(TinyTag.get, file_path)
+        audio, sample_rate, num_channels = load_audio(file_path)
+        file_hash = hash_future.result()
+        audio_file = tag_future.result()
 
     # Calculate the audio file duration
     duration = len(audio) / sample_rate
 
-    # Calculate the number of audio channels
-    num_channels = audio.shape[1] if len(audio.shape) > 1 else 1
-
-    # Calculate the maximum and average amplitude
-    max_amplitude = np.max(np.abs(audio))
-    mean_amplitude = np.mean(np.abs(audio))
+    # Calculate the maximum and average amplitude and the RMS level
+    max_amplitude, mean_amplitude, rms = calculate_audio_stats(audio)
 
     # Calculate the minimum and maximum frequencies
     min_frequency = 0
     max_frequency = sample_rate / 2
 
     # Extract metadata
-    audio_file = TinyTag.get(file_path)
     artist = audio_file.artist or "Unknown"
     title = audio_file.title or "Unknown"
     album = audio_file.album or "Unknown"
     year = audio_file.year or "Unknown"
     genre = audio_file.genre or "Unknown"
 
-    # Calculate the tempo
-    tempo, beat_frames = librosa.beat.beat_track(y=audio, sr=sample_rate)
+    # Tempo and chroma are computed on a downsampled copy of the audio
+    feature_audio, feature_sample_rate, _ = load_audio(file_path, FEATURE_SAMPLE_RATE)
 
-    # Calculate Chroma Features
-    chroma = chroma_stft(y=audio, sr=sample_rate)
-    mean_chroma = np.mean(chroma, axis=1)
+    # Calculate the tempo
+    tempo, beat_frames = librosa.beat.beat_track(y=feature_audio, sr=feature_sample_rate)
+
+    # Calculate Chroma Features on non-overlapping windows spread over the file,
+    # falling back to the whole signal when it is shorter than one window
+    window = CHROMA_WINDOW_SECONDS * feature_sample_rate
+    num_windows = min(CHROMA_WINDOWS, len(feature_audio) // window)
+    if num_windows > 0:
+        starts = np.linspace(0, len(feature_audio) - window, num_windows, dtype=int)
+        chroma_input = np.stack([feature_audio[start:start + window] for start in starts])
+    else:
+        chroma_input = feature_audio
+    chroma = chroma_stft(y=chroma_input, sr=feature_sample_rate, n_fft=2048, hop_length=512)
+    mean_chroma = np.mean(chroma.reshape(-1, 12, chroma.shape[-1]), axis=(0, 2))
 
-    # Calculate average loudness
-    loudness = librosa.amplitude_to_db(audio)
-    average_loudness = np.mean(loudness)
+    # Calculate average loudness from the RMS level
+    average_loudness = 20 * np.log10(max(rms, 1e-12))
 
     # Create the analysis results text
     file_info_text = f"File Name: {os.path.basename(file_path)}\n" \
@@ -88,8 +157,7 @@ def analyze_audio(file_path):
 
     file_analyze_text = f"\n" \
                      f"File Duration: {duration:.2f} seconds\n" \
-                     f"Sample Rate: {bitrate} Hz\n" \
-                     f"Sampling Frequency: {sample_rate} Hz\n" \
+                     f"Sample Rate: {sample_rate} Hz\n" \
                      f"Number of Channels: {num_channels}\n" \
                      f"Maximum Amplitude: {max_amplitude:.2f} (scaled value)\n" \
                      f"Average Amplitude: {mean_amplitude:.2f} (scaled value)\n" \
@@ -101,63 +169,168 @@ def analyze_audio(file_path):
 
     loudness_text = f"Average Loudness: {average_loudness:.2f} dB\n"
                     
-    chroma_text = f"\nChroma Features:\n"
-    for note, value in zip(["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"], mean_chroma):
-        chroma_text += f"{note}: {value:.3f}\n"
+    chroma_text = f"\nChroma Features:\n" + \
+                  "".join(f"{note}: {value:.3f}\n" for note, value in zip(CHROMA_NOTES, mean_chroma))
 
     results = file_info_text + metadata_text + file_analyze_text + tempo_text + loudness_text + chroma_text
     return results
 
 def calculate_file_hash(file_path):
+    hasher = hashlib.blake2b()
+
     with open(file_path, 'rb') as f:
-        hasher = hashlib.md5()
+        # Empty files cannot be memory-mapped
+        if os.fstat(f.fileno()).st_size == 0:
+            return hasher.hexdigest()
+
+        # Hash the whole mapped file in a single call
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            hasher.update(mapped)
+
+    return hasher.hexdigest()
+
+@functools.cache
+def audio_stats_kernel():
+    from numba import njit, prange
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def audio_stats(audio):
+        max_abs = 0.0
+        sum_abs = 0.0
+        sum_squares = 0.0
+
+        for i in prange(audio.shape[0]):
+            value = audio[i]
+            max_abs = max(max_abs, abs(value))
+            sum_abs += abs(value)
+            sum_squares += value * value
+
+        return max_abs, sum_abs / audio.shape[0], np.sqrt(sum_squares / audio.shape[0])
+
+    return audio_stats
+
+def calculate_audio_stats(audio):
+    # Maximum amplitude, average amplitude and RMS in a single pass over the samples,
+    # the kernel is compiled (or loaded from the numba cache) on first use
+    return audio_stats_kernel()(audio)
+
+@functools.cache
+def setup_fft_backend():
+    # Use pyfftw when it is installed so FFT plans are kept between plot clicks,
+    # otherwise stay on the default scipy/numpy FFT
+    try:
+        import pyfftw.interfaces.cache
+        import pyfftw.interfaces.numpy_fft
+        import pyfftw.interfaces.scipy_fft
+    except ImportError:
+        return
+
+    import scipy.fft
+
+    pyfftw.interfaces.cache.enable()
+    pyfftw.interfaces.cache.set_keepalive_time(60)
+    scipy.fft.set_global_backend(pyfftw.interfaces.scipy_fft)
+
+    # librosa >= 0.11 uses scipy.fft, which the global backend already covers;
+    # older versions go through their own (since deprecated) FFT library setting
+    librosa_version = importlib.metadata.version('librosa').split('.')
+    if (int(librosa_version[0]), int(librosa_version[1])) < (0, 11):
+        import librosa
+        librosa.set_fftlib(pyfftw.interfaces.numpy_fft)
 
-        for chunk in iter(lambda: f.read(4096), b''):
-            hasher.update(chunk)
+def get_frequency_spectrum(audio, sample_rate):
+    from scipy.fft import next_fast_len, rfft, rfftfreq
 
-        return hasher.hexdigest()
+    setup_fft_backend()
 
-def get_frequency_spectrum(audio, sample_rate):
-    frequencies = np.fft.fftfreq(len(audio), 1/sample_rate)
-    magnitudes = np.abs(np.fft.fft(audio))
+    # Real input: only the 0..Nyquist half of the spectrum is computed
+    # The signal is zero-padded to a fast FFT length; padding only
+    # interpolates the spectrum, it does not add any information
+    fft_size = next_fast_len(len(audio), real=True)
+    frequencies = rfftfreq(fft_size, 1/sample_rate)
+    magnitudes = np.abs(rfft(audio, n=fft_size, workers=-1))
     return frequencies, magnitudes
 
 def get_spectral_envelope(audio, sample_rate):
+    import librosa
+
+    setup_fft_backend()
     spectrogram = librosa.stft(audio)
-    envelope = librosa.amplitude_to_db(np.abs(spectrogram)).max(axis=0)
+
+    # Take the per-frame peak power first so only one dB value per frame is computed
+    power = np.square(spectrogram.real)
+    power += np.square(spectrogram.imag)
+    envelope = librosa.power_to_db(power.max(axis=0))
     return envelope
 
+def decimate_waveform(audio, max_buckets=4000):
+    # Keep the (min, max) of each bucket so the envelope of the signal is preserved
+    step = len(audio) // max_buckets
+    if step < 2:
+        return np.arange(len(audio)), audio
+
+    num_buckets = len(audio) // step
+    buckets = audio[:step * num_buckets].reshape(num_buckets, step)
+    positions = np.repeat(np.arange(num_buckets) * step, 2)
+    values = np.empty(2 * num_buckets, dtype=audio.dtype)
+    values[0::2] = buckets.min(axis=1)
+    values[1::2] = buckets.max(axis=1)
+    return positions, values
+
 # Graphical display functions
 def show_waveform(audio, sample_rate):
-    plt.figure(figsize=(12, 4))
-    plt.plot(audio)
+    import matplotlib.pyplot as plt
+
+    positions, values = decimate_waveform(audio)
+    plt.figure('Waveform', figsize=(12, 4), clear=True)
+    plt.plot(positions, values)
     plt.title('Waveform')
     plt.xlabel('Time')
     plt.ylabel('Amplitude')
     plt.show()
 
 def show_spectrogram(audio, sample_rate):
-    plt.figure(figsize=(12, 8))
-    plt.specgram(audio, Fs=sample_rate)
+    import librosa
+    import matplotlib.pyplot as plt
+
+    setup_fft_backend()
+    spectrogram = librosa.stft(audio, n_fft=2048, hop_length=512)
+    spectrogram_db = librosa.amplitude_to_db(np.abs(spectrogram), ref=np.max)
+    extent = [0, len(audio) / sample_rate, 0, sample_rate / 2]
+
+    # Update the image of an already open spectrogram window instead of redrawing it
+    plt.figure('Spectrogram', figsize=(12, 8))
+    images = plt.gca().images
+    if images:
+        images[0].set_data(spectrogram_db)
+        images[0].set_extent(extent)
+        images[0].autoscale()
+    else:
+        plt.imshow(spectrogram_db, origin='lower', aspect='auto', extent=extent)
+        plt.colorbar(format='%+2.0f dB')
     plt.title('Spectrogram')
     plt.xlabel('Time')
     plt.ylabel('Frequency')
-    plt.colorbar(format='%+2.0f dB')
     plt.show()
 
 def show_frequency_spectrum(audio, sample_rate):
+    import matplotlib.pyplot as plt
+
     frequencies, amplitudes = get_frequency_spectrum(audio, sample_rate)
-    plt.figure(figsize=(12, 6))
+    plt.figure('Frequency Spectrum', figsize=(12, 6), clear=True)
     plt.plot(frequencies, amplitudes)
     plt.title('Frequency Spectrum')
     plt.xlabel('Frequency (Hz)')
     plt.ylabel('Amplitude')
-    plt.xlim(0, sample_rate/2)
     plt.show()
 
 def show_spectral_envelope(audio, sample_rate):
+    import matplotlib.pyplot as plt
+
     envelope = get_spectral_envelope(audio, sample_rate)
-    plt.figure(figsize=(12, 6))
+    plt.figure('Spectral Envelope', figsize=(12, 6), clear=True)
     plt.plot(envelope)
     plt.title('Spectral Envelope')
     plt.xlabel('Time')
@@ -182,7 +355,7 @@ def update_file_info(file_path):
 # Function to plot audio analysis
 def plot_audio_analysis(file_path, plot_func):
     if file_path and os.path.isfile(file_path):
-        audio, sample_rate = librosa.load(file_path)
+        audio, sample_rate, _ = load_audio(file_path)
         plot_func(audio, sample_rate)
     else:
         messagebox.showerror("File Not Found", "The selected file does not exist.")